@@ -7,29 +7,252 @@ A Flask application that checks student assignments for:
 """
 
 from flask import Flask, request, jsonify
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
+import orjson
 import sqlite3
-import re
+import json
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
 import os
 # Import our AI feedback module (using Google Gemini)
-from gemini_feedback import generate_ai_feedback
+from gemini_feedback import (
+    generate_ai_feedback,
+    generate_ai_feedback_batch,
+    generate_ai_feedback_many,
+    get_cached_feedback,
+)
+
+class ORJSONProvider(JSONProvider):
+    """
+    Flask JSON provider backed by orjson, which encodes and decodes several
+    times faster than the standard json module (mostly felt on /api/assignments,
+    which grows with every submission).
+    Falls back to the standard module for what orjson refuses, such as
+    strings with lone surrogates.
+    """
+    
+    def dumps(self, obj, **kwargs):
+        try:
+            return orjson.dumps(obj).decode('utf-8')
+        except TypeError:
+            return json.dumps(obj, **kwargs)
+    
+    def loads(self, s, **kwargs):
+        try:
+            return orjson.loads(s)
+        except orjson.JSONDecodeError:
+            return json.loads(s, **kwargs)
 
 # Initialize Flask app
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 # Enable CORS to allow frontend to communicate with backend
 CORS(app)
 
+# Maximum length (in characters) of a single assignment text
+MAX_TEXT_LENGTH = 1_000_000
+# Maximum request body size (in bytes), so huge bodies are refused before parsing
+app.config['MAX_CONTENT_LENGTH'] = 2_000_000
+
+@app.before_request
+def reject_oversized_body():
+    """
+    Return 413 for requests whose declared body is over MAX_CONTENT_LENGTH,
+    before any endpoint reads or parses the body.
+    """
+    if (request.content_length is not None
+            and request.content_length > app.config['MAX_CONTENT_LENGTH']):
+        return jsonify({'error': 'Request body too large'}), 413
+
 # Database file path
 DATABASE = 'assignments.db'
 
+# Version of the schema set up by init_db, stored in PRAGMA user_version.
+# Bump it whenever init_db creates or alters anything new.
+SCHEMA_VERSION = 1
+
+# Each thread keeps its own SQLite connection and reuses it across requests
+# instead of connecting per request. isolation_level=None turns off sqlite3's
+# implicit transactions so writes are grouped explicitly with BEGIN/COMMIT.
+# With WAL, readers on one connection don't block the writer on another.
+_POOL = threading.local()
+
+def get_db():
+    """
+    Return the current thread's database connection, opening it on first use.
+    Connections are never closed by the endpoints; they live as long as the thread.
+    
+    Returns:
+        sqlite3.Connection: Connection for this thread
+    """
+    conn = getattr(_POOL, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(DATABASE, isolation_level=None, timeout=10,
+                               cached_statements=256)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        _POOL.conn = conn
+    return conn
+
+@contextmanager
+def transaction():
+    """
+    Run a block of statements as one transaction on this thread's connection.
+    Commits when the block finishes and rolls back if it raises.
+    
+    Yields:
+        sqlite3.Cursor: Cursor to execute statements with
+    """
+    conn = get_db()
+    # IMMEDIATE takes the write lock up front, so concurrent writers wait on
+    # the busy timeout instead of failing when upgrading a read lock
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        yield conn.cursor()
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    conn.execute('COMMIT')
+
+# SQL used by the endpoints. Keeping each statement as one constant string means
+# every request passes the identical string, so the connection's statement
+# cache can reuse the prepared statement instead of parsing the SQL again.
+_SQL_INSERT_ASSIGNMENT = '''
+    INSERT INTO assignments (student_name, assignment_text, word_count)
+    VALUES (?, ?, ?)
+'''
+
+_SQL_INSERT_REPORT = '''
+    INSERT INTO reports (
+        assignment_id, word_count, has_introduction, has_body, 
+        has_conclusion, long_sentences_count, long_sentences, 
+        overall_score, feedback, ai_status
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 'pending')
+'''
+
+_SQL_UPDATE_REPORT_AI = '''
+    UPDATE reports
+    SET ai_overall_evaluation = ?, ai_strengths = ?, ai_weaknesses = ?,
+        ai_suggestions = ?, ai_status = ?, ai_error = ?
+    WHERE id = ?
+'''
+
+_SQL_SELECT_REPORT = '''
+    SELECT id, assignment_id, word_count, has_introduction, has_body,
+           has_conclusion, long_sentences_count, long_sentences, overall_score,
+           feedback, ai_overall_evaluation, ai_strengths, ai_weaknesses,
+           ai_suggestions, ai_status, ai_error, created_at
+    FROM reports WHERE assignment_id = ? LIMIT 1
+'''
+
+_SQL_SELECT_CACHE = '''
+    SELECT analysis_json FROM analysis_cache WHERE key = ?
+'''
+
+_SQL_INSERT_CACHE = '''
+    INSERT OR IGNORE INTO analysis_cache (key, analysis_json) VALUES (?, ?)
+'''
+
+_SQL_FAIL_INTERRUPTED_AI = '''
+    UPDATE reports SET ai_status = 'failed', ai_error = ?
+    WHERE ai_status = 'pending'
+'''
+
+# Shown for reports whose AI job was lost when the server stopped
+INTERRUPTED_AI_ERROR = 'AI feedback generation was interrupted by a server restart. Please resubmit.'
+
+_SQL_LIST = '''
+    SELECT a.id, a.student_name, a.word_count, a.created_at, r.overall_score
+    FROM assignments a
+    LEFT JOIN reports r ON a.id = r.assignment_id
+    ORDER BY a.created_at DESC
+'''
+
+# Worker threads that generate AI feedback for saved reports in the background,
+# so submit requests don't wait on the Gemini API
+_AI_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix='ai-feedback')
+
+# Maximum number of submissions accepted by /api/submit_batch
+MAX_BATCH_SIZE = 50
+
+# Characters that end a sentence
+_TERMINATORS = '.!?'
+
+# Keywords used to detect each section
+INTRO_KEYWORDS = ('introduction', 'intro', 'introduce')
+BODY_KEYWORDS = ('body', 'main', 'content', 'discuss')
+CONCLUSION_KEYWORDS = ('conclusion', 'conclude', 'summary', 'summarize')
+
+# Feedback lines for each check as (failed, passed) pairs
+_WORD_COUNT_FEEDBACK = (
+    "⚠️ Word count is {word_count}, which is below the recommended 200 words.",
+    "✅ Word count: {word_count} words (Good!)",
+)
+_SECTION_FEEDBACK = (
+    ('has_introduction', ("❌ Missing Introduction section.", "✅ Introduction section found.")),
+    ('has_body', ("❌ Missing Body section.", "✅ Body section found.")),
+    ('has_conclusion', ("❌ Missing Conclusion section.", "✅ Conclusion section found.")),
+)
+_LONG_SENTENCE_FEEDBACK = (
+    "⚠️ Found {long_count} sentence(s) with more than 20 words. Consider breaking them into shorter sentences.",
+    "✅ All sentences are within the recommended length.",
+)
+
+def _search_terms(keywords):
+    """
+    Drop keywords that contain a shorter keyword from the same group.
+    'introduction' can only be found where 'intro' is found too, so searching
+    for it is a wasted pass over the text.
+    """
+    return tuple(k for k in keywords
+                 if not any(other != k and other in k for other in keywords))
+
+# Minimal keyword sets actually searched for by _detect_sections,
+# as bytes to match the output of _lower_ascii
+_INTRO_TERMS = tuple(k.encode() for k in _search_terms(INTRO_KEYWORDS))
+_BODY_TERMS = tuple(k.encode() for k in _search_terms(BODY_KEYWORDS))
+_CONCLUSION_TERMS = tuple(k.encode() for k in _search_terms(CONCLUSION_KEYWORDS))
+
+def _lower_ascii(text):
+    """
+    Lowercase the ASCII letters of a text for keyword matching.
+    bytes.lower() is a plain ASCII loop, whereas str.lower() goes through the
+    Unicode case tables for any non-ASCII text (about 4x slower on a 600 KB
+    essay with one accented letter). The only non-ASCII characters that
+    str.lower() maps to ASCII are 'İ' and the Kelvin sign, and neither can
+    complete a section keyword, so the matches are the same.
+    """
+    return text.encode('utf-8', 'surrogatepass').lower()
+
 def init_db():
     """
     Initialize the SQLite database.
     Creates a table to store assignment submissions if it doesn't exist.
     """
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
+    with transaction() as cursor:
+        create_schema(cursor)
+        
+        # AI jobs only live in _AI_POOL, so any report still 'pending' at
+        # startup lost its job when the previous process stopped (including
+        # every debug-mode reload) and would otherwise never finish
+        cursor.execute(_SQL_FAIL_INTERRUPTED_AI, (INTERRUPTED_AI_ERROR,))
+
+def create_schema(cursor):
+    """
+    Create or migrate the tables and indexes, using the given cursor.
+    Meant to be called inside transaction().
+    """
+    # Databases already at SCHEMA_VERSION are fully set up, so startup
+    # (including every debug-mode reload) is a single integer read
+    # instead of re-creating tables and introspecting columns
+    if cursor.execute('PRAGMA user_version').fetchone()[0] >= SCHEMA_VERSION:
+        return
     
     # Create assignments table
     cursor.execute('''
@@ -60,13 +283,27 @@ def init_db():
             ai_strengths TEXT,
             ai_weaknesses TEXT,
             ai_suggestions TEXT,
+            ai_status TEXT,
+            ai_error TEXT,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             FOREIGN KEY (assignment_id) REFERENCES assignments (id)
         )
     ''')
     
+    # Rule-based results for previously seen texts, keyed by a hash of the
+    # text, so resubmissions skip the analysis. (Databases created earlier
+    # also have an ai_json column, which is no longer used.)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS analysis_cache (
+            key TEXT PRIMARY KEY,
+            analysis_json TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
     # Add AI feedback columns to existing reports table if they don't exist
-    # This is a migration: checks if columns exist before adding them
+    # This is a migration: checks if columns exist before adding them.
+    # It only runs for databases older than SCHEMA_VERSION
     cursor.execute("PRAGMA table_info(reports)")
     columns = [column[1] for column in cursor.fetchall()]
     
@@ -78,9 +315,25 @@ def init_db():
         cursor.execute('ALTER TABLE reports ADD COLUMN ai_weaknesses TEXT')
     if 'ai_suggestions' not in columns:
         cursor.execute('ALTER TABLE reports ADD COLUMN ai_suggestions TEXT')
+    if 'ai_status' not in columns:
+        cursor.execute('ALTER TABLE reports ADD COLUMN ai_status TEXT')
+    if 'ai_error' not in columns:
+        cursor.execute('ALTER TABLE reports ADD COLUMN ai_error TEXT')
     
-    conn.commit()
-    conn.close()
+    # Indexes for the report lookup (WHERE assignment_id = ?) and the
+    # assignments list (LEFT JOIN on assignment_id, ORDER BY created_at).
+    # Including overall_score lets the join read the score from the index.
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_reports_assignment_id_score
+        ON reports (assignment_id, overall_score)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_assignments_created_at
+        ON assignments (created_at DESC)
+    ''')
+    
+    # Record that this database is up to date
+    cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
 
 def count_words(text):
     """
@@ -109,19 +362,22 @@ def check_sections(text):
     Returns:
         dict: Dictionary with boolean values for each section
     """
-    text_lower = text.lower()
-    
+    return _detect_sections(_lower_ascii(text), count_words(text))
+
+def _detect_sections(text_lower, word_count):
+    """
+    Section detection on text already lowercased by _lower_ascii.
+    Shared by check_sections and _scan so the text is only lowercased
+    and split once per analysis.
+    """
     # Check for introduction (look for keywords)
-    has_intro = any(keyword in text_lower for keyword in 
-                   ['introduction', 'intro', 'introduce'])
+    has_intro = any(keyword in text_lower for keyword in _INTRO_TERMS)
     
-    # Check for body (look for keywords or assume it exists if text is long enough)
-    has_body = any(keyword in text_lower for keyword in 
-                  ['body', 'main', 'content', 'discuss']) or len(text.split()) > 50
+    # Check for body (assume it exists if text is long enough, otherwise look for keywords)
+    has_body = word_count > 50 or any(keyword in text_lower for keyword in _BODY_TERMS)
     
     # Check for conclusion (look for keywords)
-    has_conclusion = any(keyword in text_lower for keyword in 
-                        ['conclusion', 'conclude', 'summary', 'summarize'])
+    has_conclusion = any(keyword in text_lower for keyword in _CONCLUSION_TERMS)
     
     return {
         'has_introduction': has_intro,
@@ -138,39 +394,98 @@ def find_long_sentences(text, max_words=20):
         max_words (int): Maximum words allowed per sentence (default: 20)
         
     Returns:
-        tuple: (count of long sentences, list of long sentences)
+        tuple: (count of long sentences, list of (start, end) offsets into text)
     """
-    # Split text into sentences using common punctuation
-    sentences = re.split(r'[.!?]+', text)
+    # A sentence needs at least 2 * max_words + 1 characters to hold more than
+    # max_words words, so shorter (and empty) ones are skipped without splitting
+    min_length = 2 * max_words + 1
     
-    long_sentences = []
-    for sentence in sentences:
-        sentence = sentence.strip()
-        if sentence:  # Skip empty strings
-            word_count = len(sentence.split())
-            if word_count > max_words:
-                long_sentences.append(sentence)
+    # Only offsets are kept, so long essays don't get copied sentence by sentence;
+    # callers slice out the few sentences they actually display
+    long_offsets = []
+    for start, end in _sentence_spans(text):
+        if end - start >= min_length and len(text[start:end].split()) > max_words:
+            long_offsets.append((start, end))
     
-    return len(long_sentences), long_sentences
+    return len(long_offsets), long_offsets
 
-def analyze_assignment(text):
+def _sentence_spans(text):
     """
-    Analyze an assignment and generate a comprehensive report.
+    Yield (start, end) offsets of the sentences in text,
+    splitting on runs of common punctuation (. ! ?).
+    Jumps from one terminator to the next with str.find, which scans in C,
+    instead of stepping a regex through every character. For a single
+    character str.find is memchr-based for Latin-1 text, and libc's memchr
+    already compares a machine word (or SIMD register) at a time.
+    """
+    length = len(text)
+    find = text.find
+    
+    # Next position of each terminator character (length once none are left)
+    positions = [find(ch) for ch in _TERMINATORS]
+    positions = [pos if pos != -1 else length for pos in positions]
+    
+    start = 0
+    while True:
+        end = min(positions)
+        if end == length:
+            break
+        yield start, end
+        
+        # Skip the rest of a run like '...' or '?!'
+        start = end + 1
+        while start < length and text[start] in _TERMINATORS:
+            start += 1
+        
+        # Advance the terminators that are now behind us
+        for index, pos in enumerate(positions):
+            if pos < start:
+                pos = find(_TERMINATORS[index], start)
+                positions[index] = pos if pos != -1 else length
+    
+    yield start, length
+
+def _scan(text):
+    """
+    Run the word count, section and long sentence checks together.
+    The text is split on whitespace and lowercased once, and those
+    results are reused by every check instead of each check walking
+    the text again.
     
     Args:
         text (str): The assignment text
         
     Returns:
-        dict: Analysis report with scores and feedback
+        dict: word_count, sections, long_sentences_count and long_offsets
     """
-    # Count words
     word_count = count_words(text)
+    sections = _detect_sections(_lower_ascii(text), word_count)
+    long_count, long_offsets = find_long_sentences(text)
     
-    # Check sections
-    sections = check_sections(text)
+    return {
+        'word_count': word_count,
+        'sections': sections,
+        'long_sentences_count': long_count,
+        'long_offsets': long_offsets
+    }
+
+def analyze_assignment(text):
+    """
+    Analyze an assignment and generate a comprehensive report.
     
-    # Find long sentences
-    long_count, long_sentences = find_long_sentences(text)
+    Args:
+        text (str): The assignment text
+        
+    Returns:
+        dict: Analysis report with scores and feedback
+    """
+    # Run all rule-based checks in a single scan
+    scan = _scan(text)
+    word_count = scan['word_count']
+    sections = scan['sections']
+    long_count = scan['long_sentences_count']
+    # Materialize only the sentences shown in the report
+    long_sentences = [text[start:end].strip() for start, end in scan['long_offsets'][:5]]
     
     # Calculate overall score (out of 100)
     score = 100
@@ -194,44 +509,217 @@ def analyze_assignment(text):
     score = max(0, score)
     
     # Generate feedback
-    feedback_parts = []
-    
-    if word_count < 200:
-        feedback_parts.append(f"⚠️ Word count is {word_count}, which is below the recommended 200 words.")
-    else:
-        feedback_parts.append(f"✅ Word count: {word_count} words (Good!)")
-    
-    if not sections['has_introduction']:
-        feedback_parts.append("❌ Missing Introduction section.")
-    else:
-        feedback_parts.append("✅ Introduction section found.")
-    
-    if not sections['has_body']:
-        feedback_parts.append("❌ Missing Body section.")
-    else:
-        feedback_parts.append("✅ Body section found.")
-    
-    if not sections['has_conclusion']:
-        feedback_parts.append("❌ Missing Conclusion section.")
-    else:
-        feedback_parts.append("✅ Conclusion section found.")
-    
-    if long_count > 0:
-        feedback_parts.append(f"⚠️ Found {long_count} sentence(s) with more than 20 words. Consider breaking them into shorter sentences.")
-    else:
-        feedback_parts.append("✅ All sentences are within the recommended length.")
-    
-    feedback = "\n".join(feedback_parts)
+    # Each template pair is indexed by whether the check passed
+    feedback = "\n".join((
+        _WORD_COUNT_FEEDBACK[word_count >= 200].format(word_count=word_count),
+        *(lines[bool(sections[key])] for key, lines in _SECTION_FEEDBACK),
+        _LONG_SENTENCE_FEEDBACK[long_count == 0].format(long_count=long_count),
+    ))
     
     return {
         'word_count': word_count,
         'sections': sections,
         'long_sentences_count': long_count,
-        'long_sentences': long_sentences[:5],  # Limit to first 5 for display
+        'long_sentences': long_sentences,  # Limited to the first 5 for display
         'overall_score': score,
         'feedback': feedback
     }
 
+def safe_generate_ai_feedback(assignment_text):
+    """
+    Generate AI feedback without letting an AI failure break the request.
+    
+    Args:
+        assignment_text (str): The assignment text
+        
+    Returns:
+        tuple: (AI feedback dict or None, error message or None)
+    """
+    try:
+        return generate_ai_feedback(assignment_text), None
+    except Exception as e:
+        # Log the error but don't fail the entire request
+        ai_error = str(e)
+        print(f"AI feedback generation failed: {ai_error}")
+        return None, ai_error
+
+def save_submission(cursor, student_name, assignment_text, analysis):
+    """
+    Insert an assignment and its report using the given cursor.
+    The report starts with ai_status 'pending'; run_ai_feedback fills in the
+    AI fields later.
+    Meant to be called inside transaction(), which commits both rows together.
+    
+    Returns:
+        tuple: (assignment_id, report_id)
+    """
+    cursor.execute(_SQL_INSERT_ASSIGNMENT,
+                   (student_name, assignment_text, analysis['word_count']))
+    
+    assignment_id = cursor.lastrowid
+    
+    cursor.execute(_SQL_INSERT_REPORT, (
+        assignment_id,
+        analysis['word_count'],
+        analysis['sections']['has_introduction'],
+        analysis['sections']['has_body'],
+        analysis['sections']['has_conclusion'],
+        analysis['long_sentences_count'],
+        # Stored as JSON so sentences containing newlines round-trip intact
+        json.dumps(analysis['long_sentences']),
+        analysis['overall_score'],
+        analysis['feedback']
+    ))
+    
+    return assignment_id, cursor.lastrowid
+
+def store_ai_feedback(cursor, report_id, ai_feedback, ai_error):
+    """
+    Write AI feedback (or the AI error) onto a report row using the given cursor.
+    Sets ai_status to 'complete' if there is feedback, 'failed' otherwise.
+    """
+    # Prepare AI feedback data for database storage
+    # We store lists as JSON strings in the database
+    ai_overall_eval = None
+    ai_strengths_json = None
+    ai_weaknesses_json = None
+    ai_suggestions_json = None
+    
+    if ai_feedback:
+        ai_overall_eval = ai_feedback.get('overall_evaluation')
+        ai_strengths_json = json.dumps(ai_feedback.get('strengths', []))
+        ai_weaknesses_json = json.dumps(ai_feedback.get('weaknesses', []))
+        ai_suggestions_json = json.dumps(ai_feedback.get('suggestions', []))
+    
+    cursor.execute(_SQL_UPDATE_REPORT_AI, (
+        ai_overall_eval,
+        ai_strengths_json,
+        ai_weaknesses_json,
+        ai_suggestions_json,
+        'complete' if ai_feedback else 'failed',
+        ai_error,
+        report_id
+    ))
+
+def run_ai_feedback(report_id, assignment_text):
+    """
+    Generate AI feedback for a saved report and store it on the report row.
+    Runs on _AI_POOL.
+    
+    Args:
+        report_id (int): The report to update
+        assignment_text (str): The assignment text
+    """
+    ai_feedback, ai_error = safe_generate_ai_feedback(assignment_text)
+    
+    try:
+        with transaction() as cursor:
+            store_ai_feedback(cursor, report_id, ai_feedback, ai_error)
+    except Exception as e:
+        # Nobody is waiting on this thread, so log instead of raising
+        print(f"Saving AI feedback for report {report_id} failed: {e}")
+
+def store_ai_results(cursor, pending, outcomes):
+    """
+    Store generated AI feedback (or the error that replaced it) on each report.
+    
+    Args:
+        cursor: Cursor inside transaction()
+        pending (list): (report_id, assignment_text) tuples
+        outcomes (list): Feedback dict or exception for each pending item
+    """
+    for (report_id, _), outcome in zip(pending, outcomes):
+        if isinstance(outcome, dict):
+            store_ai_feedback(cursor, report_id, outcome, None)
+        else:
+            # Any BaseException (e.g. CancelledError, whose message is empty)
+            # marks the report as failed
+            ai_error = str(outcome) or type(outcome).__name__
+            print(f"AI feedback generation failed: {ai_error}")
+            store_ai_feedback(cursor, report_id, None, ai_error)
+
+def run_ai_feedback_batch(pending):
+    """
+    Generate AI feedback for several saved reports with batched Gemini calls.
+    Runs on _AI_POOL. Reports the batch could not grade are retried with one
+    Gemini call each, all running concurrently.
+    
+    Args:
+        pending (list): (report_id, assignment_text) tuples
+    """
+    try:
+        results = generate_ai_feedback_batch([text for _, text in pending])
+    except Exception as e:
+        print(f"Batched AI feedback generation failed: {e}")
+        results = [None] * len(pending)
+    
+    graded = [(item, result) for item, result in zip(pending, results) if result]
+    retry = [item for item, result in zip(pending, results) if not result]
+    if retry:
+        outcomes = generate_ai_feedback_many([text for _, text in retry])
+        graded.extend(zip(retry, outcomes))
+    
+    try:
+        with transaction() as cursor:
+            store_ai_results(cursor, [item for item, _ in graded], [outcome for _, outcome in graded])
+    except Exception as e:
+        # Nobody is waiting on this thread, so log instead of raising
+        print(f"Saving batched AI feedback failed: {e}")
+
+def content_key(text):
+    """
+    Hash an assignment text into the key used by the analysis cache.
+    BLAKE2 runs at GB/s, so this is cheap next to the analysis itself.
+    """
+    return hashlib.blake2b(text.encode('utf-8', 'surrogatepass'), digest_size=16).hexdigest()
+
+def analyze_with_cache(text):
+    """
+    Analyze an assignment, reusing stored results if the same text was seen before.
+    
+    Args:
+        text (str): The assignment text
+        
+    Returns:
+        tuple: (analysis dict, cached AI feedback dict or None)
+    """
+    # AI feedback is cached by gemini_feedback, keyed by model and prompt
+    # version and expiring after its TTL, so only the analysis is stored here
+    ai_feedback = get_cached_feedback(text)
+    
+    key = content_key(text)
+    conn = get_db()
+    
+    row = conn.execute(_SQL_SELECT_CACHE, (key,)).fetchone()
+    if row:
+        return json.loads(row['analysis_json']), ai_feedback
+    
+    analysis = analyze_assignment(text)
+    conn.execute(_SQL_INSERT_CACHE, (key, json.dumps(analysis)))
+    return analysis, ai_feedback
+
+def required_fields(data, names):
+    """
+    Read required text fields from request JSON in one pass.
+    
+    Args:
+        data: Parsed request JSON (anything other than an object counts as empty)
+        names (tuple): Names of the required fields
+        
+    Returns:
+        tuple: (dict of stripped values, list of names that are missing, blank
+               or not strings)
+    """
+    if not isinstance(data, dict):
+        data = {}
+    
+    # Numbers, objects etc. are rejected rather than converted to text
+    fields = {}
+    for name in names:
+        value = data.get(name)
+        fields[name] = value.strip() if isinstance(value, str) else ''
+    return fields, [name for name, value in fields.items() if not value]
+
 @app.route('/api/submit', methods=['POST'])
 def submit_assignment():
     """
@@ -239,169 +727,200 @@ def submit_assignment():
     Accepts POST request with JSON containing student_name and assignment_text.
     """
     try:
-        data = request.get_json()
+        # silent=True returns None for a missing or malformed body instead of raising
+        data = request.get_json(silent=True)
         
         # Validate input
-        if not data:
-            return jsonify({'error': 'No data provided'}), 400
-        
-        student_name = data.get('student_name', '').strip()
-        assignment_text = data.get('assignment_text', '').strip()
-        
-        if not student_name:
-            return jsonify({'error': 'Student name is required'}), 400
-        
-        if not assignment_text:
-            return jsonify({'error': 'Assignment text is required'}), 400
+        fields, missing = required_fields(data, ('student_name', 'assignment_text'))
+        if missing:
+            return jsonify({'error': f"Missing or invalid required field(s): {', '.join(missing)}"}), 400
         
-        # Count words
-        word_count = count_words(assignment_text)
+        student_name = fields['student_name']
+        assignment_text = fields['assignment_text']
         
-        # Save to database
-        conn = sqlite3.connect(DATABASE)
-        cursor = conn.cursor()
+        if len(assignment_text) > MAX_TEXT_LENGTH:
+            return jsonify({'error': 'Assignment text is too large'}), 413
         
-        cursor.execute('''
-            INSERT INTO assignments (student_name, assignment_text, word_count)
-            VALUES (?, ?, ?)
-        ''', (student_name, assignment_text, word_count))
-        
-        assignment_id = cursor.lastrowid
-        
-        # Analyze assignment (rule-based checks)
-        analysis = analyze_assignment(assignment_text)
-        
-        # Generate AI feedback
-        # We use a try-except block here because AI feedback might fail
-        # but we still want to save the assignment with basic analysis
-        ai_feedback = None
-        ai_error = None
-        
-        try:
-            ai_feedback = generate_ai_feedback(assignment_text)
-        except Exception as e:
-            # Log the error but don't fail the entire request
-            ai_error = str(e)
-            print(f"AI feedback generation failed: {ai_error}")
+        # Analyze assignment (rule-based checks), reusing cached results
+        analysis, ai_feedback = analyze_with_cache(assignment_text)
         
-        # Prepare AI feedback data for database storage
-        # We store lists as JSON strings in the database
-        ai_overall_eval = None
-        ai_strengths_json = None
-        ai_weaknesses_json = None
-        ai_suggestions_json = None
+        # Save assignment and report in one transaction
+        with transaction() as cursor:
+            assignment_id, report_id = save_submission(
+                cursor, student_name, assignment_text, analysis
+            )
+            if ai_feedback:
+                store_ai_feedback(cursor, report_id, ai_feedback, None)
         
+        # Same text seen before: the report is already complete
         if ai_feedback:
-            import json as json_lib
-            ai_overall_eval = ai_feedback.get('overall_evaluation')
-            ai_strengths_json = json_lib.dumps(ai_feedback.get('strengths', []))
-            ai_weaknesses_json = json_lib.dumps(ai_feedback.get('weaknesses', []))
-            ai_suggestions_json = json_lib.dumps(ai_feedback.get('suggestions', []))
-        
-        # Save report to database (including AI feedback)
-        cursor.execute('''
-            INSERT INTO reports (
-                assignment_id, word_count, has_introduction, has_body, 
-                has_conclusion, long_sentences_count, long_sentences, 
-                overall_score, feedback, ai_overall_evaluation, 
-                ai_strengths, ai_weaknesses, ai_suggestions
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            assignment_id,
-            analysis['word_count'],
-            analysis['sections']['has_introduction'],
-            analysis['sections']['has_body'],
-            analysis['sections']['has_conclusion'],
-            analysis['long_sentences_count'],
-            '\n'.join(analysis['long_sentences']),
-            analysis['overall_score'],
-            analysis['feedback'],
-            ai_overall_eval,
-            ai_strengths_json,
-            ai_weaknesses_json,
-            ai_suggestions_json
-        ))
-        
-        report_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        
-        # Return success response with report and AI feedback
+            return jsonify({
+                'success': True,
+                'assignment_id': assignment_id,
+                'report_id': report_id,
+                'report': analysis,
+                'ai_feedback': ai_feedback,
+                'ai_status': 'complete'
+            }), 201
+        
+        # Generate AI feedback in the background; clients poll
+        # /api/report/<assignment_id> until ai_status is no longer 'pending'
+        _AI_POOL.submit(run_ai_feedback, report_id, assignment_text)
+        
+        # Return the rule-based report right away
         return jsonify({
             'success': True,
             'assignment_id': assignment_id,
             'report_id': report_id,
             'report': analysis,
-            'ai_feedback': ai_feedback,  # Will be None if AI failed
-            'ai_error': ai_error  # Will be None if AI succeeded
-        }), 201
+            'ai_status': 'pending'
+        }), 202
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/submit_batch', methods=['POST'])
+def submit_batch():
+    """
+    API endpoint to submit several assignments in one request.
+    Accepts POST request with JSON containing a 'submissions' list, where each
+    item has student_name and assignment_text.
+    All submissions are saved with a single connection and commit.
+    """
+    try:
+        # silent=True returns None for a missing or malformed body instead of raising
+        data = request.get_json(silent=True) or {}
+        
+        # Validate input
+        submissions = data.get('submissions') if isinstance(data, dict) else None
+        
+        if not isinstance(submissions, list) or not submissions:
+            return jsonify({'error': 'A non-empty submissions list is required'}), 400
+        
+        if len(submissions) > MAX_BATCH_SIZE:
+            return jsonify({'error': f'At most {MAX_BATCH_SIZE} submissions per batch'}), 400
+        
+        entries = []
+        for index, item in enumerate(submissions):
+            fields, missing = required_fields(item, ('student_name', 'assignment_text'))
+            if missing:
+                return jsonify({'error': f"Missing or invalid required field(s) in submission {index}: {', '.join(missing)}"}), 400
+            
+            student_name = fields['student_name']
+            assignment_text = fields['assignment_text']
+            
+            if len(assignment_text) > MAX_TEXT_LENGTH:
+                return jsonify({'error': f'Assignment text is too large (submission {index})'}), 413
+            
+            entries.append((student_name, assignment_text))
+        
+        # Analyze everything before touching the database
+        analyses = [analyze_with_cache(assignment_text) for _, assignment_text in entries]
+        
+        # Save all submissions in one transaction
+        saved = []
+        pending = []
+        with transaction() as cursor:
+            for (student_name, assignment_text), (analysis, ai_feedback) in zip(entries, analyses):
+                assignment_id, report_id = save_submission(
+                    cursor, student_name, assignment_text, analysis
+                )
+                result = {
+                    'assignment_id': assignment_id,
+                    'report_id': report_id,
+                    'report': analysis,
+                    'ai_status': 'pending'
+                }
+                if ai_feedback:
+                    store_ai_feedback(cursor, report_id, ai_feedback, None)
+                    result['ai_feedback'] = ai_feedback
+                    result['ai_status'] = 'complete'
+                else:
+                    pending.append((report_id, assignment_text))
+                saved.append(result)
+        
+        # Generate AI feedback in the background for texts not seen before,
+        # several assignments per Gemini call
+        if pending:
+            _AI_POOL.submit(run_ai_feedback_batch, pending)
+        
+        return jsonify({'success': True, 'results': saved}), 202 if pending else 201
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def load_long_sentences(value):
+    """
+    Decode the long_sentences column of a report.
+    Reports are stored as a JSON list; older rows used newline-joined text,
+    which is still accepted.
+    
+    Args:
+        value (str): The stored column value
+        
+    Returns:
+        list: The long sentences
+    """
+    if not value:
+        return []
+    
+    try:
+        sentences = json.loads(value)
+    except ValueError:
+        sentences = None
+    
+    if isinstance(sentences, list):
+        return sentences
+    return value.split('\n')
+
 @app.route('/api/report/<int:assignment_id>', methods=['GET'])
 def get_report(assignment_id):
     """
     API endpoint to retrieve a report for a specific assignment.
     """
     try:
-        conn = sqlite3.connect(DATABASE)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT * FROM reports WHERE assignment_id = ?
-        ''', (assignment_id,))
-        
-        report = cursor.fetchone()
-        conn.close()
+        report = get_db().execute(_SQL_SELECT_REPORT, (assignment_id,)).fetchone()
         
         if not report:
             return jsonify({'error': 'Report not found'}), 404
         
         # Convert to dictionary
-        # Handle cases where AI feedback columns might not exist (for older records)
-        import json as json_lib
+        # Columns are read by name, so older databases where the AI columns
+        # were added after created_at by the migration map correctly too
         
         report_dict = {
-            'id': report[0],
-            'assignment_id': report[1],
-            'word_count': report[2],
-            'has_introduction': bool(report[3]),
-            'has_body': bool(report[4]),
-            'has_conclusion': bool(report[5]),
-            'long_sentences_count': report[6],
-            'long_sentences': report[7].split('\n') if report[7] else [],
-            'overall_score': report[8],
-            'feedback': report[9],
+            'id': report['id'],
+            'assignment_id': report['assignment_id'],
+            'word_count': report['word_count'],
+            'has_introduction': bool(report['has_introduction']),
+            'has_body': bool(report['has_body']),
+            'has_conclusion': bool(report['has_conclusion']),
+            'long_sentences_count': report['long_sentences_count'],
+            'long_sentences': load_long_sentences(report['long_sentences']),
+            'overall_score': report['overall_score'],
+            'feedback': report['feedback'],
         }
         
         # Add AI feedback fields if they exist
-        # Check the length of the report tuple to see if AI fields are present
-        if len(report) > 10:
-            # Parse JSON strings back to lists
-            ai_feedback_dict = {}
-            if report[10]:  # ai_overall_evaluation
-                ai_feedback_dict['overall_evaluation'] = report[10]
-            if report[11]:  # ai_strengths
-                try:
-                    ai_feedback_dict['strengths'] = json_lib.loads(report[11])
-                except:
-                    ai_feedback_dict['strengths'] = []
-            if report[12]:  # ai_weaknesses
+        # Parse JSON strings back to lists
+        ai_feedback_dict = {}
+        if report['ai_overall_evaluation']:
+            ai_feedback_dict['overall_evaluation'] = report['ai_overall_evaluation']
+        for field in ('strengths', 'weaknesses', 'suggestions'):
+            if report['ai_' + field]:
                 try:
-                    ai_feedback_dict['weaknesses'] = json_lib.loads(report[12])
-                except:
-                    ai_feedback_dict['weaknesses'] = []
-            if report[13]:  # ai_suggestions
-                try:
-                    ai_feedback_dict['suggestions'] = json_lib.loads(report[13])
-                except:
-                    ai_feedback_dict['suggestions'] = []
-            
-            if ai_feedback_dict:
-                report_dict['ai_feedback'] = ai_feedback_dict
+                    ai_feedback_dict[field] = json.loads(report['ai_' + field])
+                except ValueError:
+                    ai_feedback_dict[field] = []
+        
+        if ai_feedback_dict:
+            report_dict['ai_feedback'] = ai_feedback_dict
         
-        report_dict['created_at'] = report[-1] if len(report) > 10 else report[10]
+        # Reports saved before AI feedback moved to the background have no status
+        report_dict['ai_status'] = report['ai_status'] or 'complete'
+        report_dict['ai_error'] = report['ai_error']
+        
+        report_dict['created_at'] = report['created_at']
         
         return jsonify(report_dict), 200
         
@@ -414,27 +933,16 @@ def get_assignments():
     API endpoint to retrieve all assignments.
     """
     try:
-        conn = sqlite3.connect(DATABASE)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT a.id, a.student_name, a.word_count, a.created_at, r.overall_score
-            FROM assignments a
-            LEFT JOIN reports r ON a.id = r.assignment_id
-            ORDER BY a.created_at DESC
-        ''')
-        
-        assignments = cursor.fetchall()
-        conn.close()
+        assignments = get_db().execute(_SQL_LIST).fetchall()
         
         assignments_list = []
         for assignment in assignments:
             assignments_list.append({
-                'id': assignment[0],
-                'student_name': assignment[1],
-                'word_count': assignment[2],
-                'created_at': assignment[3],
-                'overall_score': assignment[4]
+                'id': assignment['id'],
+                'student_name': assignment['student_name'],
+                'word_count': assignment['word_count'],
+                'created_at': assignment['created_at'],
+                'overall_score': assignment['overall_score']
             })
         
         return jsonify(assignments_list), 200
@@ -452,33 +960,29 @@ def check_assignment():
     Returns analysis report with both rule-based checks and AI feedback.
     """
     try:
-        data = request.get_json()
+        # silent=True returns None for a missing or malformed body instead of raising
+        data = request.get_json(silent=True)
         
         # Validate input
-        if not data:
-            return jsonify({'error': 'No data provided'}), 400
+        fields, missing = required_fields(data, ('assignment_text',))
+        if missing:
+            return jsonify({'error': f"Missing or invalid required field(s): {', '.join(missing)}"}), 400
         
-        assignment_text = data.get('assignment_text', '').strip()
+        assignment_text = fields['assignment_text']
         
-        if not assignment_text:
-            return jsonify({'error': 'Assignment text is required'}), 400
+        if len(assignment_text) > MAX_TEXT_LENGTH:
+            return jsonify({'error': 'Assignment text is too large'}), 413
         
-        # Perform rule-based analysis (word count, sections, long sentences)
-        analysis = analyze_assignment(assignment_text)
-        
-        # Generate AI feedback
-        # We use a try-except block here because AI feedback might fail
-        # (e.g., API key issues, network problems) but we still want to return the basic analysis
-        ai_feedback = None
+        # Perform rule-based analysis (word count, sections, long sentences),
+        # reusing cached results for texts seen before
+        analysis, ai_feedback = analyze_with_cache(assignment_text)
         ai_error = None
         
-        try:
-            ai_feedback = generate_ai_feedback(assignment_text)
-        except Exception as e:
-            # Log the error but don't fail the entire request
-            # This way, users still get the basic analysis even if AI is unavailable
-            ai_error = str(e)
-            print(f"AI feedback generation failed: {ai_error}")
+        # Generate AI feedback if it isn't cached yet
+        # AI feedback might fail (e.g., API key issues, network problems)
+        # but we still want to return the basic analysis
+        if not ai_feedback:
+            ai_feedback, ai_error = safe_generate_ai_feedback(assignment_text)
         
         # Prepare the response
         response_data = {
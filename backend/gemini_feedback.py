@@ -14,112 +14,734 @@ Output format (JSON):
 """
 
 import os
-import json
+import re
+import array
+import copy
+import functools
+import asyncio
+import concurrent.futures
+import math
+import operator
+import time
+import hashlib
+import threading
+import sqlite3
+from collections import OrderedDict
+from typing import Any, Coroutine, Dict, List, Optional, Tuple, TypeVar, Union
+import orjson
+from aiolimiter import AsyncLimiter
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential_jitter
 from dotenv import load_dotenv
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
 
-# Load .env explicitly from backend directory
+# Load .env explicitly from backend directory, unless the key is already set
+# (e.g. injected by the hosting platform), which saves reading the file
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 ENV_PATH = os.path.join(BASE_DIR, ".env")
-load_dotenv(ENV_PATH)
+if not os.environ.get("GEMINI_API_KEY"):
+    load_dotenv(ENV_PATH)
 
+# Parsed feedback dict, unit-length embedding, and a text waiting for a batched
+# call: (index in the batch, cache key, embedding, prepared text)
+Feedback = Dict[str, Any]
+Vector = List[float]
+PendingText = Tuple[int, str, Optional[Vector], str]
+T = TypeVar("T")
 
-def generate_ai_feedback(text):
+# Use stable, supported model
+MODEL_NAME = "models/gemini-flash-lite-latest"
+
+# Bump whenever the prompt changes, so feedback cached for the old prompt is not reused
+PROMPT_VERSION = 2
+
+# Exact-match cache of parsed feedback, so identical texts (resubmissions,
+# test runs, duplicate uploads) skip the Gemini call entirely
+CACHE_MAX_ENTRIES = 1024
+CACHE_TTL_SECONDS = 7 * 86400
+_cache: "OrderedDict[str, Tuple[float, Feedback]]" = OrderedDict()  # key -> (expires_at, feedback), oldest first
+_cache_lock = threading.Lock()
+
+
+def _cache_key(text: str) -> str:
+    """
+    Key for the feedback cache: model, prompt version and a hash of the text.
+    """
+    digest = hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).hexdigest()
+    return f"{MODEL_NAME}:{PROMPT_VERSION}:{digest}"
+
+
+# Both caches are backed by a SQLite file, so cached feedback survives restarts.
+# The in-memory structures above and below stay the fast first tier.
+CACHE_DB_PATH = os.path.join(BASE_DIR, "feedback_cache.db")
+_cache_db_local = threading.local()  # one connection per thread
+
+
+def _cache_db() -> sqlite3.Connection:
+    """
+    Return this thread's connection to the persistent cache, creating the
+    table and dropping expired rows on first use.
+    """
+    conn = getattr(_cache_db_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(CACHE_DB_PATH, timeout=10, isolation_level=None)
+        # WAL lets lookups read while another thread writes; reads are mmap'd
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA mmap_size=268435456")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache (
+                hash TEXT PRIMARY KEY,
+                embedding BLOB,
+                feedback BLOB NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        conn.execute("DELETE FROM cache WHERE created_at < ?", (time.time() - CACHE_TTL_SECONDS,))
+        _cache_db_local.conn = conn
+    return conn
+
+
+def _db_get(key: str) -> Optional[Tuple[Feedback, float]]:
+    """
+    Return (feedback, created_at) stored for key and not yet expired, or None.
+    A failing cache database only costs the lookup.
+    """
+    try:
+        row = _cache_db().execute(
+            "SELECT feedback, created_at FROM cache WHERE hash = ? AND created_at >= ?",
+            (key, time.time() - CACHE_TTL_SECONDS),
+        ).fetchone()
+    except sqlite3.Error as e:
+        print(f"Reading feedback cache database failed: {e}")
+        return None
+
+    if row is None:
+        return None
+    return orjson.loads(row[0]), row[1]
+
+
+def _db_put(key: str, feedback: Feedback, vector: Optional[Vector] = None) -> None:
+    """
+    Persist feedback (and the embedding of its text, if known) under key.
+    """
+    embedding = array.array("f", vector).tobytes() if vector is not None else None
+    try:
+        _cache_db().execute(
+            """
+            INSERT INTO cache (hash, embedding, feedback, created_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT (hash) DO UPDATE SET
+                embedding = COALESCE(excluded.embedding, embedding),
+                feedback = excluded.feedback,
+                created_at = excluded.created_at
+            """,
+            (key, embedding, orjson.dumps(feedback), time.time()),
+        )
+    except sqlite3.Error as e:
+        print(f"Writing feedback cache database failed: {e}")
+
+
+def _cache_get(key: str) -> Optional[Feedback]:
+    """
+    Return a copy of the cached feedback for key, or None if missing or expired.
+    Falls back to the cache database when the key is not in memory.
+    """
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None:
+            expires_at, feedback = entry
+            if expires_at < time.monotonic():
+                del _cache[key]
+            else:
+                _cache.move_to_end(key)
+                # Copy so callers can't modify the cached value
+                return copy.deepcopy(feedback)
+
+    stored = _db_get(key)
+    if stored is None:
+        return None
+    feedback, created_at = stored
+    _memory_put(key, feedback, CACHE_TTL_SECONDS - (time.time() - created_at))
+    return feedback
+
+
+def _memory_put(key: str, feedback: Feedback, ttl: float = CACHE_TTL_SECONDS) -> None:
+    """
+    Store feedback in memory under key, evicting the least recently used
+    entries when full.
+    """
+    with _cache_lock:
+        _cache[key] = (time.monotonic() + ttl, copy.deepcopy(feedback))
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+
+
+def _cache_put(key: str, feedback: Feedback, vector: Optional[Vector] = None) -> None:
+    """
+    Store feedback under key in memory and in the cache database.
+    """
+    _memory_put(key, feedback)
+    _db_put(key, feedback, vector)
+
+
+# Semantic cache: near-duplicate submissions (same problem statement, very
+# similar answers) reuse earlier feedback when their embeddings are close enough.
+# An embedding call takes milliseconds, a generation call takes seconds.
+EMBEDDING_MODEL = "models/text-embedding-004"
+# Cosine similarity above which earlier feedback is reused. Kept high because
+# different essays on the same topic already score around 0.9.
+SEMANTIC_CACHE_THRESHOLD = 0.95
+SEMANTIC_CACHE_MAX_ENTRIES = 1024
+# Only the start of the (whitespace-normalized) text is embedded
+EMBEDDING_MAX_CHARS = 4000
+_semantic_entries: List[Tuple[Vector, Feedback]] = []  # (unit-length embedding, feedback), oldest first
+_semantic_lock = threading.Lock()
+_semantic_loaded = False  # whether _semantic_entries was filled from the database
+
+
+def _embed(text: str) -> Optional[Vector]:
+    """
+    Return a unit-length embedding of the text, or None if embedding fails.
+    A failed embedding only disables the semantic cache for this call.
+    """
+    normalized = " ".join(text.split())[:EMBEDDING_MAX_CHARS]
+    try:
+        result = genai.embed_content(
+            model=EMBEDDING_MODEL,
+            content=normalized,
+            task_type="semantic_similarity",
+        )
+    except Exception as e:
+        print(f"Embedding for semantic cache failed: {e}")
+        return None
+
+    vector = result["embedding"]
+    norm = math.sqrt(sum(x * x for x in vector))
+    if not norm:
+        return None
+    return [x / norm for x in vector]
+
+
+def _semantic_get(vector: Vector) -> Optional[Feedback]:
+    """
+    Return a copy of the feedback of the most similar cached submission,
+    or None if none is above SEMANTIC_CACHE_THRESHOLD.
+    """
+    with _semantic_lock:
+        if not _semantic_loaded:
+            _load_semantic_entries()
+        entries = list(_semantic_entries)
+
+    best_score, best_feedback = SEMANTIC_CACHE_THRESHOLD, None
+    for stored, feedback in entries:
+        # Both vectors are unit length, so the dot product is the cosine similarity
+        score = sum(map(operator.mul, vector, stored))
+        if score > best_score:
+            best_score, best_feedback = score, feedback
+
+    return copy.deepcopy(best_feedback) if best_feedback is not None else None
+
+
+def _load_semantic_entries() -> None:
+    """
+    Fill _semantic_entries with the newest embeddings stored for the current
+    model and prompt version. Called once, with _semantic_lock held.
+    """
+    global _semantic_loaded
+    _semantic_loaded = True
+
+    prefix = f"{MODEL_NAME}:{PROMPT_VERSION}:"
+    try:
+        rows = _cache_db().execute(
+            """
+            SELECT embedding, feedback FROM cache
+            WHERE embedding IS NOT NULL AND substr(hash, 1, ?) = ? AND created_at >= ?
+            ORDER BY created_at DESC LIMIT ?
+            """,
+            (len(prefix), prefix, time.time() - CACHE_TTL_SECONDS, SEMANTIC_CACHE_MAX_ENTRIES),
+        ).fetchall()
+    except sqlite3.Error as e:
+        print(f"Reading feedback cache database failed: {e}")
+        return
+
+    for embedding, feedback in reversed(rows):
+        _semantic_entries.append((array.array("f", embedding).tolist(), orjson.loads(feedback)))
+
+
+def _semantic_put(vector: Vector, feedback: Feedback) -> None:
+    """
+    Remember feedback for an embedding, dropping the oldest entries when full.
+    """
+    with _semantic_lock:
+        if not _semantic_loaded:
+            _load_semantic_entries()
+        _semantic_entries.append((vector, copy.deepcopy(feedback)))
+        del _semantic_entries[:-SEMANTIC_CACHE_MAX_ENTRIES]
+
+
+# Schema Gemini's JSON mode fills in for each assignment, so the prompt doesn't
+# have to spell out the format and the output is always parseable
+_POINTS = {
+    "type": "array",
+    "items": {"type": "string"},
+    "description": "3 short points",
+}
+FEEDBACK_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "overall_evaluation": {"type": "string", "description": "max 2 sentences"},
+        "strengths": _POINTS,
+        "weaknesses": _POINTS,
+        "suggestions": _POINTS,
+    },
+    "required": ["overall_evaluation", "strengths", "weaknesses", "suggestions"],
+}
+
+# Prompt built once; the assignment text goes between head and tail
+_PROMPT_HEAD = """
+Give teacher feedback on this assignment. Keep values short.
+
+Text:
+"""
+_PROMPT_TAIL = "\n"
+
+# Texts currently being graded: cache key -> concurrent.futures.Future of the feedback
+_inflight: Dict[str, "concurrent.futures.Future[Feedback]"] = {}
+_inflight_lock = threading.Lock()
+
+# Longest assignment text sent to Gemini; anything after this is dropped and
+# replaced by _TRUNCATION_NOTE, so the model doesn't grade the cut-off ending
+PROMPT_MAX_CHARS = 16000
+_TRUNCATION_NOTE = (
+    "\n\n[Note: the assignment was cut off here because it is too long. "
+    "Do not penalize the missing ending or conclusion.]"
+)
+
+
+def _prepare_text(text: str) -> str:
+    """
+    Collapse runs of whitespace (keeping one line break between non-empty lines)
+    and cap the text at PROMPT_MAX_CHARS, so no input tokens are spent on padding.
+    """
+    lines = (" ".join(line.split()) for line in text.splitlines())
+    normalized = "\n".join(line for line in lines if line)
+    if len(normalized) > PROMPT_MAX_CHARS:
+        return normalized[:PROMPT_MAX_CHARS] + _TRUNCATION_NOTE
+    return normalized
+
+# Low temperature for deterministic formatting
+_GEN_CONFIG: Dict[str, Any] = {
+    "temperature": 0.1,
+    "max_output_tokens": 500,
+    "response_mime_type": "application/json",
+    "response_schema": FEEDBACK_SCHEMA,
+}
+
+# Retry settings: a truncated response is retried with a larger output budget,
+# an invalid one with this note appended to the prompt
+_FINISH_MAX_TOKENS = genai.protos.Candidate.FinishReason.MAX_TOKENS
+RETRY_MAX_OUTPUT_TOKENS = 1500
+_INVALID_JSON_NUDGE = "\nThe previous output was invalid JSON. Return only JSON.\n"
+
+# Maximum number of assignments graded in one batched Gemini call
+BATCH_SIZE = 5
+
+# Pace Gemini calls below the per-minute quota (about 10% under 60 RPM) and cap
+# how many are in flight, so concurrent grading doesn't trigger 429s
+RATE_LIMIT_REQUESTS = 55
+RATE_LIMIT_PERIOD_SECONDS = 60
+MAX_CONCURRENT_REQUESTS = 10
+# Upper bound on one Gemini call, so a stalled connection can't hold a slot forever
+REQUEST_TIMEOUT_SECONDS = 30
+
+# All Gemini calls run on one long-lived event loop in a daemon thread, so the
+# SDK's async channel (and its TLS session) stays open between calls and the
+# limiter and semaphore below pace every call in the process. The async
+# functions in this module must be awaited on _LOOP; the sync wrappers do that.
+_LOOP = asyncio.new_event_loop()
+threading.Thread(target=_LOOP.run_forever, name="gemini-loop", daemon=True).start()
+
+_LIMITER = AsyncLimiter(RATE_LIMIT_REQUESTS, RATE_LIMIT_PERIOD_SECONDS)
+_SEMAPHORE = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+
+def _run(coro: Coroutine[Any, Any, T]) -> T:
+    """
+    Run a coroutine on _LOOP and block the calling thread until it finishes.
+    """
+    return asyncio.run_coroutine_threadsafe(coro, _LOOP).result()
+
+
+@retry(
+    retry=retry_if_exception_type((
+        google_exceptions.ResourceExhausted,
+        google_exceptions.ServiceUnavailable,
+    )),
+    stop=stop_after_attempt(4),
+    wait=wait_exponential_jitter(initial=0.5, max=8),
+    reraise=True,
+)
+async def _generate(
+    model: genai.GenerativeModel, prompt: str, generation_config: Dict[str, Any]
+) -> Tuple[str, Any]:
+    """
+    Make one streamed generate_content_async call, waiting for a free slot and
+    for the rate limiter first.
+    Rate-limit (429) and unavailable (503) errors are retried up to 3 times with
+    jittered exponential backoff; the slot is released while waiting.
+
+    Returns:
+        tuple: (stripped response text, finish reason of the last chunk)
+    """
+    async with _SEMAPHORE:
+        async with _LIMITER:
+            response = await model.generate_content_async(
+                prompt,
+                generation_config=generation_config,
+                stream=True,
+                request_options={"timeout": REQUEST_TIMEOUT_SECONDS},
+            )
+
+            # Collect text as it arrives; a cut-off stream still leaves
+            # the partial output here
+            pieces: List[str] = []
+            finish_reason = None
+            async for chunk in response:
+                if not chunk.candidates:
+                    continue
+                candidate = chunk.candidates[0]
+                pieces.extend(part.text for part in candidate.content.parts)
+                finish_reason = candidate.finish_reason or finish_reason
+
+    return "".join(pieces).strip(), finish_reason
+
+
+@functools.lru_cache(maxsize=1)
+def _get_model() -> genai.GenerativeModel:
+    """
+    Read the API key, configure the Gemini SDK and build the model, once.
+    Raises ValueError (and caches nothing) while the key is missing.
+    """
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        raise ValueError("GEMINI_API_KEY not found in .env")
+
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel(MODEL_NAME)
+
+
+def _lookup_caches(text: str) -> Tuple[str, Optional[Vector], Optional[Feedback]]:
+    """
+    Check the exact-match cache, then the semantic cache.
+
+    Returns:
+        tuple: (exact cache key, embedding or None, cached feedback or None)
+    """
+    # Identical text already graded with this model and prompt
+    key = _cache_key(text)
+    cached = _cache_get(key)
+    if cached is not None:
+        return key, None, cached
+
+    # Also configures the SDK for the embedding call
+    _get_model()
+
+    # Near-duplicate of a text graded before
+    vector = _embed(text)
+    if vector is not None:
+        similar = _semantic_get(vector)
+        if similar is not None:
+            _cache_put(key, similar)
+            return key, vector, similar
+
+    return key, vector, None
+
+
+def get_cached_feedback(text: str) -> Optional[Feedback]:
+    """
+    Return feedback already cached for this exact text (same model and prompt
+    version, not expired), without calling Gemini, or None.
+    """
+    return _cache_get(_cache_key(_prepare_text(text)))
+
+
+def _remember(key: str, vector: Optional[Vector], feedback: Feedback) -> None:
+    """
+    Store freshly generated feedback in both caches.
+    """
+    _cache_put(key, feedback, vector)
+    if vector is not None:
+        _semantic_put(vector, feedback)
+
+
+# Outermost object / array in the model output, for the fast path of extract_json
+_JSON_RE = {
+    "{": re.compile(r"\{.*\}", re.DOTALL),
+    "[": re.compile(r"\[.*\]", re.DOTALL),
+}
+
+# Characters the balanced-brace walk reacts to; everything else is skipped in C
+_STRUCTURAL_RE = {
+    "{": re.compile(r'[\\"{}]'),
+    "[": re.compile(r'[\\"\[\]]'),
+}
+
+
+def extract_json(raw_text: str, opener: str = "{") -> Any:
+    """
+    Extracts a complete JSON value using balanced brace parsing.
+    This handles cases where the model output is truncated or contains extra text.
+    Pass opener="[" to extract an array instead of an object.
+
+    Well-formed output (bare JSON, or JSON wrapped in a code fence) is parsed
+    directly; the balanced-brace walk only runs when that fails.
+    """
+    closer = "}" if opener == "{" else "]"
+    expected_type = dict if opener == "{" else list
+
+    # Fast path: the whole response, then everything from the first opener to the last closer
+    try:
+        value = orjson.loads(raw_text)
+        if isinstance(value, expected_type):
+            return value
+    except ValueError:
+        pass
+
+    match = _JSON_RE[opener].search(raw_text)
+    if match:
+        try:
+            return orjson.loads(match.group(0))
+        except ValueError:
+            pass
+
+    start = raw_text.find(opener)
+    if start == -1:
+        raise Exception("No JSON value found in Gemini response")
+
+    brace_count = 0
+    in_string = False
+    escaped_at = -1  # position of the character following a backslash
+
+    # Jump straight from one structural character to the next
+    for match in _STRUCTURAL_RE[opener].finditer(raw_text, start):
+        i = match.start()
+        if i == escaped_at:
+            continue
+
+        ch = match.group()
+
+        if ch == "\\":
+            escaped_at = i + 1
+            continue
+
+        if ch == '"':
+            in_string = not in_string
+            continue
+
+        if not in_string:
+            if ch == opener:
+                brace_count += 1
+            elif ch == closer:
+                brace_count -= 1
+                if brace_count == 0:
+                    json_block = raw_text[start:i + 1]
+                    return orjson.loads(json_block)
+
+    raise Exception(f"Incomplete JSON (missing closing {closer})")
+
+
+async def generate_ai_feedback_async(text: str) -> Feedback:
     """
     Sends assignment text to Gemini and returns structured feedback as dict.
     Handles:
     - API key loading
     - Model selection
-    - JSON-only prompting
+    - JSON mode with a response schema
     - Truncated output recovery
     - Brace-balanced JSON extraction
+    - Exact-match and semantic (embedding similarity) caching of previous results
+    - Sharing one Gemini call between concurrent requests for the same text
+
+    Awaiting several of these with asyncio.gather overlaps their network round-trips.
     """
 
-    # Read API key
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        raise ValueError("GEMINI_API_KEY not found in .env")
+    text = _prepare_text(text)
+    key = _cache_key(text)
 
-    # Configure Gemini SDK
-    genai.configure(api_key=api_key)
+    # The shared result is a thread-safe concurrent.futures.Future, which
+    # waiters can await from any event loop through asyncio.wrap_future
+    with _inflight_lock:
+        existing = _inflight.get(key)
+        if existing is None:
+            future: "concurrent.futures.Future[Feedback]" = concurrent.futures.Future()
+            _inflight[key] = future
 
-    # Use stable, supported model
-    model = genai.GenerativeModel("models/gemini-flash-lite-latest")
+    if existing is not None:
+        # Same text is already being graded: wait for that call instead of making
+        # another. shield() keeps a cancelled waiter from cancelling the shared
+        # future under the owner and the other waiters.
+        return copy.deepcopy(await asyncio.shield(asyncio.wrap_future(existing)))
 
+    try:
+        feedback = await _generate_feedback(text)
+    except BaseException as e:
+        if not future.done():
+            future.set_exception(e)
+        raise
+    else:
+        if not future.done():
+            future.set_result(feedback)
+        return copy.deepcopy(feedback)
+    finally:
+        with _inflight_lock:
+            del _inflight[key]
 
-    # Strict JSON-only prompt
-    prompt = f"""
-Return ONLY valid JSON. Keep values short. No explanations.
 
-{{
-  "overall_evaluation": "max 2 sentences",
-  "strengths": ["p1","p2","p3"],
-  "weaknesses": ["p1","p2","p3"],
-  "suggestions": ["p1","p2","p3"]
-}}
+async def _generate_feedback(text: str) -> Feedback:
+    """
+    Caches-then-Gemini path of generate_ai_feedback_async for one prepared text.
+    """
+    # Cache lookups may call the (blocking) embedding API
+    key, vector, cached = await asyncio.to_thread(_lookup_caches, text)
+    if cached is not None:
+        return cached
 
-Text:
-{text}
-"""
+    model = _get_model()
+    prompt = "".join((_PROMPT_HEAD, text, _PROMPT_TAIL))
 
-    # Low temperature for deterministic formatting
-    generation_config = {
-    "temperature": 0.1,
-    "max_output_tokens": 500
-    }
+    generation_config = _GEN_CONFIG
 
-    def call_model():
-        return model.generate_content(prompt, generation_config=generation_config)
-
-    def extract_json(raw_text):
-        """
-        Extracts a complete JSON object using balanced brace parsing.
-        This handles cases where the model output is truncated or contains extra text.
-        """
-        start = raw_text.find("{")
-        if start == -1:
-            raise Exception("No JSON object found in Gemini response")
-
-        brace_count = 0
-        in_string = False
-        escape = False
-
-        for i in range(start, len(raw_text)):
-            ch = raw_text[i]
-
-            if escape:
-                escape = False
-                continue
-
-            if ch == "\\":
-                escape = True
-                continue
-
-            if ch == '"':
-                in_string = not in_string
-                continue
-
-            if not in_string:
-                if ch == "{":
-                    brace_count += 1
-                elif ch == "}":
-                    brace_count -= 1
-                    if brace_count == 0:
-                        json_block = raw_text[start:i + 1]
-                        return json.loads(json_block)
-
-        raise Exception("Incomplete JSON (missing closing brace)")
-
-    # Try once, retry once on truncation
+    # Try once, retry once with settings aimed at why the first output failed
     for attempt in range(2):
-        response = call_model()
-        raw_text = response.candidates[0].content.parts[0].text.strip()
+        raw_text, finish_reason = await _generate(model, prompt, generation_config)
 
         try:
             feedback = extract_json(raw_text)
-            return feedback
         except Exception as e:
             if attempt == 1:
                 raise Exception(f"Gemini API error: {str(e)}")
 
+            if finish_reason == _FINISH_MAX_TOKENS:
+                # Cut off: give the same prompt more room
+                generation_config = {**_GEN_CONFIG, "max_output_tokens": RETRY_MAX_OUTPUT_TOKENS}
+            else:
+                # Complete but unparseable: be deterministic and say what went wrong
+                generation_config = {**_GEN_CONFIG, "temperature": 0}
+                prompt = "".join((prompt, _INVALID_JSON_NUDGE))
+            continue
+
+        # Cache writes may wait on a locked cache database, so they must not
+        # block the shared event loop
+        await asyncio.to_thread(_remember, key, vector, feedback)
+        return feedback
+
     raise Exception("Gemini API error: Unknown failure")
+
+
+def generate_ai_feedback(text: str) -> Feedback:
+    """
+    Synchronous wrapper around generate_ai_feedback_async.
+    Must not be called from inside a coroutine running on _LOOP.
+    """
+    return _run(generate_ai_feedback_async(text))
+
+
+async def generate_ai_feedback_many_async(texts: List[str]) -> List[Union[Feedback, BaseException]]:
+    """
+    Grades each text with its own Gemini call, all calls running concurrently.
+
+    Returns:
+        list: feedback dict, or the exception raised, for each text in order
+    """
+    return await asyncio.gather(
+        *(generate_ai_feedback_async(text) for text in texts),
+        return_exceptions=True,
+    )
+
+
+def generate_ai_feedback_many(texts: List[str]) -> List[Union[Feedback, BaseException]]:
+    """
+    Synchronous wrapper around generate_ai_feedback_many_async.
+    """
+    return _run(generate_ai_feedback_many_async(texts))
+
+
+async def _grade_chunk(
+    model: genai.GenerativeModel, chunk: List[PendingText], results: List[Optional[Feedback]]
+) -> None:
+    """
+    Grades up to BATCH_SIZE pending texts with one Gemini call and stores the
+    feedback in results. Leaves results untouched if the call fails.
+    """
+    submissions = "\n\n".join(
+        f"### Submission {number}\n{text}"
+        for number, (_, _, _, text) in enumerate(chunk, 1)
+    )
+    prompt = f"""
+Give teacher feedback on each of these {len(chunk)} assignments, one array item per submission, in order.
+Keep values short.
+
+{submissions}
+"""
+    # Output budget grows with the number of submissions in the call
+    generation_config = {
+        **_GEN_CONFIG,
+        "max_output_tokens": _GEN_CONFIG["max_output_tokens"] * len(chunk),
+        "response_schema": {"type": "array", "items": FEEDBACK_SCHEMA},
+    }
+
+    try:
+        raw_text, _ = await _generate(model, prompt, generation_config)
+        feedback_list = extract_json(raw_text, opener="[")
+    except Exception as e:
+        print(f"Batched Gemini call failed: {e}")
+        return
+
+    if not isinstance(feedback_list, list) or len(feedback_list) != len(chunk):
+        print("Batched Gemini call returned the wrong number of results")
+        return
+
+    for (index, key, vector, _), feedback in zip(chunk, feedback_list):
+        if isinstance(feedback, dict):
+            # Off the event loop, like the single-text path
+            await asyncio.to_thread(_remember, key, vector, feedback)
+            results[index] = feedback
+
+
+async def generate_ai_feedback_batch_async(texts: List[str]) -> List[Optional[Feedback]]:
+    """
+    Grades several assignments with one Gemini call per BATCH_SIZE texts
+    instead of one call per text, and returns their feedback dicts in order.
+    The batched calls run concurrently.
+
+    Texts found in the caches are not sent. An entry is None when its feedback
+    could not be obtained from the batched call (API error, truncated or
+    mismatched output); callers can retry those with generate_ai_feedback.
+    """
+    texts = [_prepare_text(text) for text in texts]
+    results: List[Optional[Feedback]] = [None] * len(texts)
+    pending: List[PendingText] = []
+
+    lookups = await asyncio.gather(*(asyncio.to_thread(_lookup_caches, text) for text in texts))
+    for index, (text, (key, vector, cached)) in enumerate(zip(texts, lookups)):
+        if cached is not None:
+            results[index] = cached
+        else:
+            pending.append((index, key, vector, text))
+
+    model = _get_model()
+
+    await asyncio.gather(*(
+        _grade_chunk(model, pending[start:start + BATCH_SIZE], results)
+        for start in range(0, len(pending), BATCH_SIZE)
+    ))
+
+    return results
+
+
+def generate_ai_feedback_batch(texts: List[str]) -> List[Optional[Feedback]]:
+    """
+    Synchronous wrapper around generate_ai_feedback_batch_async.
+    """
+    return _run(generate_ai_feedback_batch_async(texts))
@@ -115,6 +115,24 @@ function ReportDisplay({ report }: ReportDisplayProps) {
         </div>
       </div>
 
+      {/* AI Feedback placeholder while it is generated in the background */}
+      {!report.ai_feedback && report.ai_status === 'pending' && (
+        <div className="report-section ai-feedback-section">
+          <h3>🤖 AI Feedback</h3>
+          <p className="ai-feedback-text">⏳ Generating AI feedback...</p>
+        </div>
+      )}
+
+      {/* AI Feedback could not be generated */}
+      {!report.ai_feedback && report.ai_status === 'failed' && (
+        <div className="report-section ai-feedback-section">
+          <h3>🤖 AI Feedback</h3>
+          <p className="ai-feedback-text">
+            ⚠️ AI feedback is unavailable{report.ai_error ? `: ${report.ai_error}` : '.'}
+          </p>
+        </div>
+      )}
+
       {/* AI Feedback Card */}
       {report.ai_feedback && (
         <div className="report-section ai-feedback-section">
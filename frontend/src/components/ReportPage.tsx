@@ -9,6 +9,12 @@ import ReportDisplay from './ReportDisplay'
 import type { Report } from '../types'
 import './ReportPage.css'
 
+// How often to re-fetch a report while its AI feedback is still being generated
+const AI_POLL_INTERVAL_MS = 2000
+// Stop polling after this many attempts (about 3 minutes)
+const AI_MAX_POLLS = 90
+const AI_TIMEOUT_MESSAGE = 'AI feedback is taking longer than expected. Refresh the page to check again.'
+
 function ReportPage() {
   const { id } = useParams<{ id: string }>()
   const navigate = useNavigate()
@@ -18,8 +24,14 @@ function ReportPage() {
 
   /**
    * Fetch report from backend API
+   * AI feedback is generated in the background, so keep polling
+   * while the report's ai_status is 'pending', up to AI_MAX_POLLS times
    */
   useEffect(() => {
+    let pollTimer: ReturnType<typeof setTimeout> | undefined
+    let cancelled = false
+    let polls = 0
+
     const fetchReport = async () => {
       if (!id) {
         setError('Invalid assignment ID')
@@ -28,7 +40,6 @@ function ReportPage() {
       }
 
       try {
-        setLoading(true)
         const response = await fetch(`/api/report/${id}`)
 
         if (!response.ok) {
@@ -51,17 +62,40 @@ function ReportPage() {
           overall_score: data.overall_score,
           feedback: data.feedback,
           ai_feedback: data.ai_feedback || null,
+          ai_status: data.ai_status,
+          ai_error: data.ai_error || null,
+        }
+
+        if (cancelled) return
+
+        if (reportData.ai_status === 'pending') {
+          if (polls < AI_MAX_POLLS) {
+            polls += 1
+            pollTimer = setTimeout(fetchReport, AI_POLL_INTERVAL_MS)
+          } else {
+            // Give up instead of showing the placeholder forever
+            reportData.ai_status = 'failed'
+            reportData.ai_error = AI_TIMEOUT_MESSAGE
+          }
         }
 
         setReport(reportData)
       } catch (err) {
-        setError(err instanceof Error ? err.message : 'An unexpected error occurred')
+        if (!cancelled) {
+          setError(err instanceof Error ? err.message : 'An unexpected error occurred')
+        }
       } finally {
-        setLoading(false)
+        if (!cancelled) setLoading(false)
       }
     }
 
+    setLoading(true)
     fetchReport()
+
+    return () => {
+      cancelled = true
+      clearTimeout(pollTimer)
+    }
   }, [id])
 
   if (loading) {
@@ -9,6 +9,8 @@ export interface AIFeedback {
   suggestions: string[]
 }
 
+export type AIStatus = 'pending' | 'complete' | 'failed'
+
 export interface Report {
   word_count: number
   sections: {
@@ -21,6 +23,8 @@ export interface Report {
   overall_score: number
   feedback: string
   ai_feedback?: AIFeedback | null
+  ai_status?: AIStatus
+  ai_error?: string | null
 }
 
 export interface Assignment {
@@ -43,5 +47,7 @@ export interface ReportResponse {
   overall_score: number
   feedback: string
   ai_feedback?: AIFeedback | null
+  ai_status?: AIStatus
+  ai_error?: string | null
   created_at: string
 }